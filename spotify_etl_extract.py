@@ -1,8 +1,20 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RetryError
+from urllib3.util.retry import Retry
 import os
-import json
-import pandas as pd # Optional: Useful for transforming data later
+import orjson
+import zstandard as zstd
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import wraps
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import numpy as np
+import pandas as pd # Flattens the API JSON (json_normalize) for the Parquet files
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime # Optional: For timestamping extracts
 
 # --- Configuration ---
@@ -18,9 +30,41 @@ SCOPE = "user-read-private user-read-email user-library-read user-top-read user-
 DATA_DIR = "spotify_data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# JSON Lines output: one compact JSON object per line
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+
+# Remembers each extracted playlist's snapshot_id so unchanged playlists are not re-fetched
+PLAYLIST_CACHE_FILE = os.path.join(DATA_DIR, ".cache", "playlists.json")
+
+# Number of pages fetched concurrently (kept low to stay within Spotify's rate limit)
+MAX_WORKERS = 8
+
+# Timeout in seconds for page requests made directly on Spotipy's session
+REQUEST_TIMEOUT = 10
+
+# Minimum number of rows per row group when streaming pages into a Parquet file
+PARQUET_BATCH_SIZE = 500
+
 # --- Authentication ---
 try:
     sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=SCOPE))
+    # Keep-alive pool large enough for the concurrent fetches, so every page reuses a connection
+    # instead of paying a new TCP + TLS handshake. Only server errors are retried here; 429s (which urllib3
+    # would otherwise retry whenever they carry Retry-After) are left to retry_on_rate_limit
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                          respect_retry_after_header=False)
+    )
+    sp._session.mount('https://', adapter)
+    # Pages are fetched from several threads; serialize token lookups so an expired token is refreshed once
+    token_lock = threading.Lock()
+    unlocked_get_access_token = sp.auth_manager.get_access_token
+    def get_access_token(*args, **kwargs):
+        with token_lock:
+            return unlocked_get_access_token(*args, **kwargs)
+    sp.auth_manager.get_access_token = get_access_token
     print("Authentication successful.")
     user_info = sp.current_user()
     print(f"Authenticated as: {user_info['display_name']} ({user_info['id']})")
@@ -31,135 +75,391 @@ except Exception as e:
 
 # --- Data Extraction Functions ---
 
-def save_data(data, filename_prefix):
-    """Saves data to a JSON file with a timestamp."""
+# File writes run on a single background thread so extraction keeps fetching while data is written.
+# The save functions return the filename they wrote; progress is printed from the main thread.
+writer = ThreadPoolExecutor(max_workers=1)
+pending_writes = []
+
+def save_data(records, filename_prefix):
+    """Saves a list of records to a zstd-compressed JSON Lines file with a timestamp, so it can be read back in chunks."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = os.path.join(DATA_DIR, f"{filename_prefix}_{timestamp}.json")
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    print(f"Data saved to {filename}")
+    filename = os.path.join(DATA_DIR, f"{filename_prefix}_{timestamp}.jsonl.zst")
+    # Repeated keys compress very well; threads=-1 compresses on all CPU cores
+    compressor = zstd.ZstdCompressor(level=3, threads=-1)
+    with open(filename, 'wb') as raw, compressor.stream_writer(raw) as f: # orjson emits UTF-8 bytes
+        for record in records:
+            f.write(orjson.dumps(record, option=JSON_OPTIONS))
+    return filename
+
+def save_parquet(df, filename_prefix, schema=None):
+    """Saves a DataFrame to a Snappy-compressed Parquet file with a timestamp, using `schema` for the column types if given."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(DATA_DIR, f"{filename_prefix}_{timestamp}.parquet")
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), filename, compression='snappy')
+    return filename
+
+def open_parquet_writer(schema, filename_prefix):
+    """Opens a Snappy-compressed Parquet file with a timestamp that tables can be appended to."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(DATA_DIR, f"{filename_prefix}_{timestamp}.parquet")
+    return pq.ParquetWriter(filename, schema, compression='snappy')
+
+def close_parquet_writer(parquet_writer):
+    """Closes a writer from open_parquet_writer and returns the filename it wrote."""
+    parquet_writer.close()
+    return parquet_writer.where
+
+def discard_parquet_writer(parquet_writer):
+    """Closes a writer from open_parquet_writer and deletes its partially written file."""
+    parquet_writer.close()
+    os.remove(parquet_writer.where)
+
+def run_in_background(func, *args, **kwargs):
+    """Queues func(*args, **kwargs) on the writer thread, tracks it in pending_writes and returns its future."""
+    future = writer.submit(func, *args, **kwargs)
+    pending_writes.append(future)
+    return future
+
+def load_playlist_cache():
+    """Loads the playlist_id -> {snapshot_id, parquet_path} cache written by earlier runs."""
+    try:
+        with open(PLAYLIST_CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+def save_playlist_cache(cache):
+    """Writes the playlist cache atomically so an interrupted run never leaves it half-written."""
+    os.makedirs(os.path.dirname(PLAYLIST_CACHE_FILE), exist_ok=True)
+    tmp_filename = PLAYLIST_CACHE_FILE + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        f.write(orjson.dumps(cache))
+    os.replace(tmp_filename, PLAYLIST_CACHE_FILE)
+
+# json_normalize column paths -> output column names for the fields of a nested 'track' object
+TRACK_COLUMNS = {
+    'track.id': 'track_id',
+    'track.name': 'track_name',
+    'artist_ids': 'artist_ids',
+    'artist_names': 'artist_names',
+    'track.album.id': 'album_id',
+    'track.album.name': 'album_name'
+}
+TRACK_DETAIL_COLUMNS = {
+    'track.duration_ms': 'duration_ms',
+    'track.popularity': 'popularity',
+    'track.external_urls.spotify': 'external_url',
+    'track.preview_url': 'preview_url',
+    'track.is_local': 'is_local'
+}
+
+def select_columns(df, columns):
+    """Picks the json_normalize columns in `columns` (path -> output name) and renames them.
+
+    Columns absent from every item (e.g. the ID of local tracks) are filled with
+    None rather than float NaN, so the Parquet schema decides their type.
+    """
+    for path in columns:
+        if path not in df:
+            df[path] = None
+    return df[list(columns)].rename(columns=columns)
+
+def flatten_tracks(items, columns):
+    """Flattens items holding a nested 'track' object into a DataFrame with the given columns.
+
+    `columns` maps json_normalize column paths to output names; 'artist_ids' and
+    'artist_names' are built from the track's artists.
+    """
+    df = pd.json_normalize(items)
+    # Collect the artist IDs and names in a single pass over each track's artists
+    artist_ids, artist_names = [], []
+    for artists in df.get('track.artists', []):
+        ids, names = [], []
+        if isinstance(artists, list): # Artists can be missing (NaN after normalizing), e.g. for podcast episodes
+            for artist in artists:
+                ids.append(artist['id'])
+                names.append(artist['name'])
+        artist_ids.append(ids)
+        artist_names.append(names)
+    # dtype=object keeps the list columns from turning into float64 when there are no items
+    df['artist_ids'] = pd.Series(artist_ids, index=df.index, dtype=object)
+    df['artist_names'] = pd.Series(artist_names, index=df.index, dtype=object)
+    return select_columns(df, columns)
+
+# Server-side field filter for playlist items: only what flatten_tracks() keeps, plus the paging fields
+PLAYLIST_ITEM_FIELDS = (
+    "total,next,items(added_at,added_by.id,"
+    "track(id,name,duration_ms,popularity,is_local,preview_url,external_urls.spotify,album(id,name),artists(id,name)))"
+)
+
+# Numeric audio features that are standardized after extraction
+AUDIO_FEATURE_KEYS = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms'
+]
 
-def get_all_paginated_items(spotify_func, *args, **kwargs):
+# Explicit Parquet schemas, so column types don't depend on which fields a given run happened to see
+TRACK_FIELDS = [
+    ('track_id', pa.string()),
+    ('track_name', pa.string()),
+    ('artist_ids', pa.list_(pa.string())),
+    ('artist_names', pa.list_(pa.string())),
+    ('album_id', pa.string()),
+    ('album_name', pa.string())
+]
+TRACK_DETAIL_FIELDS = [
+    ('duration_ms', pa.int64()),
+    ('popularity', pa.int64()),
+    ('external_url', pa.string()),
+    ('preview_url', pa.string()),
+    ('is_local', pa.bool_())
+]
+SAVED_TRACK_SCHEMA = pa.schema([('added_at', pa.string()), *TRACK_FIELDS, *TRACK_DETAIL_FIELDS])
+PLAYLIST_TRACK_SCHEMA = pa.schema([
+    ('playlist_id', pa.string()),
+    ('added_at', pa.string()),
+    ('added_by_id', pa.string()),
+    *TRACK_FIELDS,
+    *TRACK_DETAIL_FIELDS
+])
+RECENTLY_PLAYED_SCHEMA = pa.schema([
+    ('played_at', pa.string()),
+    *TRACK_FIELDS,
+    ('context_type', pa.string()),
+    ('context_uri', pa.string())
+])
+USER_PLAYLIST_SCHEMA = pa.schema([
+    ('playlist_id', pa.string()),
+    ('playlist_name', pa.string()),
+    ('owner_id', pa.string()),
+    ('owner_name', pa.string()),
+    ('description', pa.string()),
+    ('public', pa.bool_()),
+    ('collaborative', pa.bool_()),
+    ('track_count', pa.int64()),
+    ('snapshot_id', pa.string()),
+    ('external_url', pa.string())
+])
+
+def standardize_features(features):
+    """Z-scores each column of an (N, k) float32 array, ignoring NaNs; constant columns become 0."""
+    # Accumulate in float64 so a constant float32 column gets a standard deviation of exactly 0
+    means = np.nanmean(features, axis=0, dtype=np.float64)
+    stds = np.nanstd(features, axis=0, dtype=np.float64)
+    stds[stds == 0] = 1
+    return ((features - means) / stds).astype(np.float32)
+
+def retry_on_rate_limit(func, max_attempts=5):
+    """Retries a Spotify call on HTTP 429, sleeping for the response's 'Retry-After' interval.
+
+    This is the only layer that retries rate limits; the session's Retry handles server errors only.
+    A 429 without headers is Spotipy reporting that those retries gave up, so it is raised as is.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(max_attempts):
+            try:
+                return func(*args, **kwargs)
+            except spotipy.SpotifyException as e:
+                if e.http_status != 429 or not e.headers or attempt == max_attempts - 1:
+                    raise
+                retry_after = int(e.headers.get('Retry-After', 1))
+                time.sleep(retry_after)
+    return wrapper
+
+auth_headers = {}
+
+def get_auth_headers(refresh=False):
+    """Returns the bearer-token header, looking the token up only on first use or when refresh is set."""
+    if refresh or not auth_headers:
+        auth_headers['Authorization'] = f"Bearer {sp.auth_manager.get_access_token(as_dict=False)}"
+    return dict(auth_headers)
+
+def get_page(url):
+    """Fetches one page by URL on Spotipy's session, skipping Spotipy's per-call request building."""
+    try:
+        response = sp._session.get(url, headers=get_auth_headers(), timeout=REQUEST_TIMEOUT)
+        if response.status_code == 401: # Token expired during the run: refresh it and try once more
+            response = sp._session.get(url, headers=get_auth_headers(refresh=True), timeout=REQUEST_TIMEOUT)
+    except RetryError as e:
+        # The session's Retry gave up on 5xx responses; report it like Spotipy does (429, no headers)
+        raise spotipy.SpotifyException(429, -1, f"{url}: Max Retries", reason=str(e.args[0].reason)) from e
+    if response.status_code >= 400:
+        # Raise Spotipy's exception so retry_on_rate_limit and the callers handle it as before
+        raise spotipy.SpotifyException(response.status_code, -1, f"{url}: {response.reason}", headers=response.headers)
+    return response.json()
+
+def page_url(url, offset, **params):
+    """Returns the paging URL with its 'offset' replaced and the given query parameters set."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    # Re-apply the original request's parameters (e.g. fields=) in case 'next' does not carry them
+    query.update({key: value for key, value in params.items() if value is not None})
+    query['offset'] = offset
+    return parts._replace(query=urlencode(query)).geturl()
+
+def iter_paginated_pages(spotify_func, *args, limit=50, max_workers=MAX_WORKERS, **kwargs):
+    """Yields the items of each page of a paginated Spotify endpoint, in order.
+
+    The first page (fetched through Spotipy) reveals the total number of items
+    and the 'next' URL; the remaining pages are then fetched concurrently by
+    rewriting that URL's offset, max_workers at a time, so only that many pages
+    are held in memory while the caller consumes them.
+    """
+    results = retry_on_rate_limit(spotify_func)(*args, limit=limit, **kwargs)
+    yield results['items']
+    if not results['next']:
+        return
+    fetch_page = retry_on_rate_limit(get_page)
+    offsets = range(limit, results['total'], limit)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start in range(0, len(offsets), max_workers):
+            pages = executor.map(
+                lambda offset: fetch_page(page_url(results['next'], offset, **kwargs)),
+                offsets[start:start + max_workers]
+            )
+            for page in pages: # map() yields pages in offset order
+                yield page['items']
+
+def iter_item_batches(pages, batch_size):
+    """Regroups pages of items into batches of at least batch_size items (the last one may be smaller)."""
+    batch = []
+    for items in pages:
+        batch.extend(items)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_all_paginated_items(spotify_func, *args, limit=50, max_workers=MAX_WORKERS, **kwargs):
     """Helper function to retrieve all items from a paginated Spotify endpoint."""
-    results = spotify_func(*args, **kwargs)
-    all_items = results['items']
-    while results['next']:
-        results = sp.next(results) # Fetches the next page
-        all_items.extend(results['items'])
+    all_items = []
+    for items in iter_paginated_pages(spotify_func, *args, limit=limit, max_workers=max_workers, **kwargs):
+        all_items.extend(items)
     return all_items
 
+def fetch_playlist_tracks(playlist_id):
+    """Fetches all tracks of a playlist and flattens them into a DataFrame."""
+    # Note: Playlist items endpoint has a slightly different structure.
+    # Pages are fetched one at a time here because the playlists themselves are fetched concurrently.
+    playlist_tracks = get_all_paginated_items(
+        sp.playlist_items, playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=100, max_workers=1 # Max limit is 100 here
+    )
+    # Skip if track is None (can happen with local files, etc.)
+    playlist_tracks = [item for item in playlist_tracks if item and item['track']]
+    processed_playlist_tracks = flatten_tracks(playlist_tracks, {
+        'added_at': 'added_at', 'added_by.id': 'added_by_id', **TRACK_COLUMNS, **TRACK_DETAIL_COLUMNS
+    })
+    processed_playlist_tracks.insert(0, 'playlist_id', playlist_id) # Add playlist ID for context
+    processed_playlist_tracks['is_local'] = processed_playlist_tracks['is_local'].fillna(False)
+    return processed_playlist_tracks
+
 # --- Example Extraction Tasks ---
 
 # 1. Get User's Saved Tracks (Library)
+track_ids_for_features = [] # Set only once the whole library was saved, used in step 4
 try:
     print("\nFetching saved tracks...")
-    saved_tracks = get_all_paginated_items(sp.current_user_saved_tracks, limit=50)
-    # Process track data if needed (e.g., simplify structure)
-    processed_tracks = []
-    for item in saved_tracks:
-        track = item['track']
-        processed_tracks.append({
-            'added_at': item['added_at'],
-            'track_id': track['id'],
-            'track_name': track['name'],
-            'artist_ids': [artist['id'] for artist in track['artists']],
-            'artist_names': [artist['name'] for artist in track['artists']],
-            'album_id': track['album']['id'],
-            'album_name': track['album']['name'],
-            'duration_ms': track['duration_ms'],
-            'popularity': track['popularity'],
-            'external_url': track['external_urls']['spotify'],
-            'preview_url': track['preview_url'],
-            'is_local': track['is_local']
-        })
-    save_data(processed_tracks, "saved_tracks")
-    print(f"Fetched {len(processed_tracks)} saved tracks.")
+    # Stream the library: each batch of pages is flattened and appended to the Parquet file
+    # on the writer thread, so memory stays bounded by the batch size rather than the library size
+    saved_tracks_writer = open_parquet_writer(SAVED_TRACK_SCHEMA, "saved_tracks")
+    saved_track_ids = []
+    try:
+        saved_track_pages = iter_paginated_pages(sp.current_user_saved_tracks, limit=50)
+        for saved_tracks in iter_item_batches(saved_track_pages, PARQUET_BATCH_SIZE):
+            # Drop local tracks (no ID, no audio features) before flattening rather than filtering afterwards
+            saved_tracks = [item for item in saved_tracks if item['track']['id'] and not item['track']['is_local']]
+            if not saved_tracks: # The whole batch was local tracks
+                continue
+            # Process track data: flatten the nested JSON and keep only the columns we need
+            processed_tracks = flatten_tracks(saved_tracks, {'added_at': 'added_at', **TRACK_COLUMNS, **TRACK_DETAIL_COLUMNS})
+            saved_track_ids.extend(processed_tracks['track_id'])
+            table = pa.Table.from_pandas(processed_tracks, schema=SAVED_TRACK_SCHEMA, preserve_index=False)
+            run_in_background(saved_tracks_writer.write_table, table)
+    except Exception:
+        # Don't leave a partial file behind; this runs after the batches already queued for writing
+        run_in_background(discard_parquet_writer, saved_tracks_writer)
+        raise
+    run_in_background(close_parquet_writer, saved_tracks_writer)
+    track_ids_for_features = saved_track_ids
+    print(f"Fetched {len(saved_track_ids)} saved tracks.")
 except Exception as e:
     print(f"Error fetching saved tracks: {e}")
 
 # 2. Get User's Playlists
+processed_playlists = pd.DataFrame() # Stays empty if fetching the playlists fails
 try:
     print("\nFetching user playlists...")
     playlists = get_all_paginated_items(sp.current_user_playlists, limit=50)
-    processed_playlists = []
-    for playlist in playlists:
-         processed_playlists.append({
-            'playlist_id': playlist['id'],
-            'playlist_name': playlist['name'],
-            'owner_id': playlist['owner']['id'],
-            'owner_name': playlist['owner']['display_name'],
-            'description': playlist['description'],
-            'public': playlist['public'],
-            'collaborative': playlist['collaborative'],
-            'track_count': playlist['tracks']['total'],
-            'snapshot_id': playlist['snapshot_id'],
-            'external_url': playlist['external_urls']['spotify']
-        })
-    save_data(processed_playlists, "user_playlists")
+    processed_playlists = select_columns(pd.json_normalize(playlists), {
+        'id': 'playlist_id',
+        'name': 'playlist_name',
+        'owner.id': 'owner_id',
+        'owner.display_name': 'owner_name',
+        'description': 'description',
+        'public': 'public',
+        'collaborative': 'collaborative',
+        'tracks.total': 'track_count',
+        'snapshot_id': 'snapshot_id',
+        'external_urls.spotify': 'external_url'
+    })
+    run_in_background(save_parquet, processed_playlists, "user_playlists", schema=USER_PLAYLIST_SCHEMA)
     print(f"Fetched {len(processed_playlists)} playlists.")
 except Exception as e:
     print(f"Error fetching playlists: {e}")
 
-# 3. Get Tracks from a Specific Playlist (Example: first playlist found)
-#    In a real ETL, you'd likely iterate through all playlist IDs from the previous step.
-if processed_playlists:
-    try:
-        first_playlist_id = processed_playlists[0]['playlist_id']
-        first_playlist_name = processed_playlists[0]['playlist_name']
-        print(f"\nFetching tracks for playlist: '{first_playlist_name}' ({first_playlist_id})...")
-        # Note: Playlist items endpoint has a slightly different structure
-        playlist_items_results = sp.playlist_items(first_playlist_id, limit=100) # Max limit is 100 here
-        playlist_tracks = playlist_items_results['items']
-        while playlist_items_results['next']:
-             playlist_items_results = sp.next(playlist_items_results)
-             playlist_tracks.extend(playlist_items_results['items'])
-
-        processed_playlist_tracks = []
-        for item in playlist_tracks:
-             # Skip if track is None (can happen with local files, etc.)
-             if not item or not item['track']:
-                 continue
-             track = item['track']
-             processed_playlist_tracks.append({
-                'playlist_id': first_playlist_id, # Add playlist ID for context
-                'added_at': item['added_at'],
-                'added_by_id': item['added_by']['id'] if item.get('added_by') else None,
-                'track_id': track.get('id'), # Use .get() as ID might be missing for local tracks
-                'track_name': track.get('name'),
-                'artist_ids': [artist['id'] for artist in track.get('artists', [])],
-                'artist_names': [artist['name'] for artist in track.get('artists', [])],
-                'album_id': track.get('album', {}).get('id'),
-                'album_name': track.get('album', {}).get('name'),
-                'duration_ms': track.get('duration_ms'),
-                'popularity': track.get('popularity'),
-                'external_url': track.get('external_urls', {}).get('spotify'),
-                'preview_url': track.get('preview_url'),
-                'is_local': track.get('is_local', False)
-            })
-
-        save_data(processed_playlist_tracks, f"playlist_{first_playlist_id}_tracks")
-        print(f"Fetched {len(processed_playlist_tracks)} tracks from playlist '{first_playlist_name}'.")
-    except Exception as e:
-        print(f"Error fetching tracks for playlist {first_playlist_id}: {e}")
+# 3. Get Tracks from every Playlist
+playlist_cache = load_playlist_cache()
+playlist_writes = {} # playlist_id -> (snapshot_id, future of the Parquet write)
+if not processed_playlists.empty:
+    playlists_to_fetch = []
+    for playlist in processed_playlists.itertuples(index=False):
+        cached = playlist_cache.get(playlist.playlist_id)
+        # The snapshot_id changes whenever the playlist does, so a match means the cached tracks are current
+        if cached and cached['snapshot_id'] == playlist.snapshot_id and os.path.exists(cached['parquet_path']):
+            print(f"Playlist '{playlist.playlist_name}' unchanged since last run, tracks already in {cached['parquet_path']}")
+        else:
+            playlists_to_fetch.append(playlist)
+
+    print(f"\nFetching tracks for {len(playlists_to_fetch)} playlists...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_playlist_tracks, playlist.playlist_id): playlist for playlist in playlists_to_fetch}
+        for future in as_completed(futures):
+            playlist = futures[future]
+            try:
+                processed_playlist_tracks = future.result()
+            except Exception as e:
+                print(f"Error fetching tracks for playlist {playlist.playlist_id}: {e}")
+                continue
+            write = run_in_background(
+                save_parquet, processed_playlist_tracks, f"playlist_{playlist.playlist_id}_tracks", schema=PLAYLIST_TRACK_SCHEMA
+            )
+            playlist_writes[playlist.playlist_id] = (playlist.snapshot_id, write)
+            print(f"Fetched {len(processed_playlist_tracks)} tracks from playlist '{playlist.playlist_name}'.")
 
 
 # 4. Get Audio Features for Tracks (Example: for saved tracks)
 #    Note: API limit of 100 track IDs per call
-track_ids_for_features = [track['track_id'] for track in processed_tracks if track['track_id'] and not track['is_local']] # Ensure ID exists and not local
 if track_ids_for_features:
     try:
         print(f"\nFetching audio features for {len(track_ids_for_features)} saved tracks...")
-        all_audio_features = []
-        # Process in batches of 100
-        for i in range(0, len(track_ids_for_features), 100):
-            batch_ids = track_ids_for_features[i:i + 100]
-            batch_features = sp.audio_features(batch_ids)
+        # Process in batches of 100, requesting the batches concurrently
+        batches = [track_ids_for_features[i:i + 100] for i in range(0, len(track_ids_for_features), 100)]
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            batch_results = executor.map(retry_on_rate_limit(sp.audio_features), batches)
             # Filter out None results (can happen if a track ID is invalid)
-            all_audio_features.extend([f for f in batch_features if f])
+            all_audio_features = [f for batch_features in batch_results for f in batch_features if f]
 
-        save_data(all_audio_features, "saved_tracks_audio_features")
+        run_in_background(save_data, all_audio_features, "saved_tracks_audio_features")
         print(f"Fetched audio features for {len(all_audio_features)} tracks.")
 
+        # Stage the features as one (N, 12) float32 array and z-score every column at once
+        features = pd.DataFrame(all_audio_features, columns=AUDIO_FEATURE_KEYS).to_numpy(dtype=np.float32)
+        normalized_features = pd.DataFrame(standardize_features(features), columns=AUDIO_FEATURE_KEYS)
+        normalized_features.insert(0, 'track_id', [f['id'] for f in all_audio_features])
+        run_in_background(save_parquet, normalized_features, "saved_tracks_audio_features_normalized")
+
     except Exception as e:
         print(f"Error fetching audio features: {e}")
 
@@ -172,35 +472,46 @@ try:
     # We might not need the helper function here if we only want the last 50.
     # For full history, you'd need cursor-based pagination logic.
     recently_played = sp.current_user_recently_played(limit=50)
-    processed_recent = []
-    for item in recently_played.get('items', []):
-        track = item['track']
-        processed_recent.append({
-            'played_at': item['played_at'],
-            'track_id': track['id'],
-            'track_name': track['name'],
-            'artist_ids': [artist['id'] for artist in track['artists']],
-            'artist_names': [artist['name'] for artist in track['artists']],
-            'album_id': track['album']['id'],
-            'album_name': track['album']['name'],
-            'context_type': item['context']['type'] if item.get('context') else None, # e.g., 'playlist', 'album', 'artist'
-            'context_uri': item['context']['uri'] if item.get('context') else None,
-        })
-
-    save_data(processed_recent, "recently_played")
+    processed_recent = flatten_tracks(recently_played.get('items', []), {
+        'played_at': 'played_at',
+        **TRACK_COLUMNS,
+        'context.type': 'context_type', # e.g., 'playlist', 'album', 'artist'; None when played from elsewhere
+        'context.uri': 'context_uri'
+    })
+
+    run_in_background(save_parquet, processed_recent, "recently_played", schema=RECENTLY_PLAYED_SCHEMA)
     print(f"Fetched {len(processed_recent)} recently played tracks.")
 except Exception as e:
     print(f"Error fetching recently played tracks: {e}")
 
 
+# Wait for the background writes to finish before reporting completion
+print()
+for future in pending_writes:
+    try:
+        filename = future.result()
+    except Exception as e:
+        print(f"Error saving data: {e}")
+        continue
+    if filename: # write_table() calls for streamed batches return None
+        print(f"Data saved to {filename}")
+writer.shutdown()
+
+# Only cache playlists whose tracks were written successfully
+for playlist_id, (snapshot_id, write) in playlist_writes.items():
+    if write.exception() is None:
+        playlist_cache[playlist_id] = {'snapshot_id': snapshot_id, 'parquet_path': write.result()}
+save_playlist_cache(playlist_cache)
+
 print("\n--- Extraction Complete ---")
 print(f"Data saved in '{DATA_DIR}' directory.")
 
 # --- Next Steps (ETL) ---
-# Now you have the raw data (JSON files).
+# Now you have the raw data (Parquet files for tracks and playlists, zstd-compressed JSON Lines files for audio features).
 # The next steps in your ETL process would be:
 # 1. Transform:
-#    - Load the JSON files (e.g., using pandas: df = pd.read_json(filepath))
+#    - Load the files (e.g., using pandas: df = pd.read_parquet(filepath), or stream JSON Lines with
+#      pd.read_json(filepath, lines=True, chunksize=10000); pandas infers the .zst compression)
 #    - Clean the data (handle missing values, duplicates)
 #    - Normalize/Structure the data (e.g., create separate tables for tracks, artists, albums, plays)
 #    - Add timestamps for ETL processing